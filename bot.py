@@ -5,18 +5,19 @@ DIFFYE-CTF Bot - Bot de Telegram para CTF del Curso Búsqueda y Captura de Fugit
 Versión completa con keep-alive para UptimeRobot
 """
 
-import threading
-import http.server
-import socketserver
 import os
 import logging
 import asyncio
+import sys
+import time
 import aiohttp
+from aiohttp import web
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import (
     Application,
+    BaseUpdateProcessor,
     CommandHandler,
     MessageHandler,
     CallbackQueryHandler,
@@ -79,39 +80,49 @@ WAITING_NAME, WAITING_FLAG = range(2)
 #
 
 # ==================== SERVIDOR WEB CON KEEP-ALIVE ====================
-class KeepAliveHandler(http.server.SimpleHTTPRequestHandler):
-    """Servidor HTTP mejorado para UptimeRobot y monitoreo"""
-    
-    def log_message(self, format, *args):
-        """Suprimir logs del servidor web para evitar spam"""
-        return
-        
-    def do_GET(self):
-        if self.path == '/health':
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            response = {'status': 'healthy', 'service': 'diffye-ctf-bot', 'timestamp': datetime.now(TZ).isoformat()}
-            self.wfile.write(str(response).replace("'", '"').encode())
-        else:
-            self.send_response(200)
-            self.send_header('Content-type', 'text/html; charset=utf-8')
-            self.end_headers()
-            html_content = """
-            <!DOCTYPE html><html lang="es"><head><title>🔍 DIFFYE-CTF Bot</title></head>
-            <body><h1>🔍 DIFFYE-CTF Bot</h1><p>Estado: 🟢 ACTIVO</p>
-            <p><small>🤖 Servidor funcionando correctamente.</small></p></body></html>
-            """
-            self.wfile.write(html_content.encode('utf-8'))
-
-def start_web_server():
-    """Inicia el servidor web para keep-alive"""
-    try:
-        httpd = socketserver.TCPServer(("", PORT), KeepAliveHandler)
-        logger.info(f"🌐 Servidor web iniciado en puerto {PORT}")
-        httpd.serve_forever()
-    except Exception as e:
-        logger.error(f"❌ Error en servidor web: {e}")
+KEEP_ALIVE_HTML = """
+<!DOCTYPE html><html lang="es"><head><title>🔍 DIFFYE-CTF Bot</title></head>
+<body><h1>🔍 DIFFYE-CTF Bot</h1><p>Estado: 🟢 ACTIVO</p>
+<p><small>🤖 Servidor funcionando correctamente.</small></p></body></html>
+"""
+
+class KeepAliveWebServer:
+    """Servidor HTTP para UptimeRobot y monitoreo, en el mismo event loop del bot"""
+
+    def __init__(self):
+        self.runner = None
+
+    async def _health(self, request):
+        return web.json_response({
+            'status': 'healthy',
+            'service': 'diffye-ctf-bot',
+            'timestamp': datetime.now(TZ).isoformat()
+        })
+
+    async def _index(self, request):
+        return web.Response(text=KEEP_ALIVE_HTML, content_type='text/html', charset='utf-8')
+
+    async def start(self):
+        """Inicia el servidor web para keep-alive (aiohttp ya activa TCP_NODELAY en cada conexión)"""
+        try:
+            app = web.Application()
+            app.router.add_get('/health', self._health)
+            app.router.add_get('/{tail:.*}', self._index)
+
+            # Sin access log para evitar spam
+            self.runner = web.AppRunner(app, access_log=None)
+            await self.runner.setup()
+            site = web.TCPSite(self.runner, port=PORT)
+            await site.start()
+            logger.info(f"🌐 Servidor web iniciado en puerto {PORT}")
+        except Exception as e:
+            logger.error(f"❌ Error en servidor web: {e}")
+
+    async def stop(self):
+        """Detiene el servidor web"""
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
 
 # ==================== KEEP-ALIVE INTERNO ====================
 class KeepAliveService:
@@ -170,7 +181,8 @@ class KeepAliveService:
         except Exception as e:
             logger.error(f"❌ Keep-alive ping error: {e}")
 
-# Instancia global del servicio
+# Instancias globales de los servicios
+web_server = KeepAliveWebServer()
 keep_alive_service = KeepAliveService()
 
 # ==================== MONITOR DE ACTIVIDAD ====================
@@ -207,13 +219,17 @@ activity_monitor = ActivityMonitor()
 
 # ==================== FUNCIONES DEL BOT ====================
 
+# Tabla de reemplazos precalculada para sanitize_text (una sola pasada con translate)
+_SANITIZE_TABLE = str.maketrans({
+    '_': ' ', '*': ' ', '[': '(', ']': ')',
+    '`': "'", '~': '-', '>': ' ', '<': ' '
+})
+
 def sanitize_text(text):
     """Sanitiza texto de usuario para evitar problemas con caracteres especiales"""
     if not text:
         return "Sin nombre"
-    sanitized = str(text).replace('_', ' ').replace('*', ' ').replace('[', '(').replace(']', ')')
-    sanitized = sanitized.replace('`', "'").replace('~', '-').replace('>', ' ').replace('<', ' ')
-    return sanitized[:50]
+    return str(text).translate(_SANITIZE_TABLE)[:50]
 
 def get_challenge_availability_date(challenge_id):
     """Calcula la fecha de disponibilidad de cada desafío"""
@@ -224,31 +240,42 @@ def get_challenge_availability_date(challenge_id):
 
 def is_challenge_available(challenge_id):
     """Verifica si un desafío está disponible en la fecha actual"""
-    current_time = datetime.now(TZ)
-    challenge_date = get_challenge_availability_date(challenge_id)
-    return current_time >= challenge_date
+    return time.time() >= CHALLENGE_DATES_TS[challenge_id]
 
 def get_time_until_unlock(challenge_id):
     """Obtiene el tiempo restante hasta que se desbloquee un desafío"""
-    current_time = datetime.now(TZ)
-    challenge_date = get_challenge_availability_date(challenge_id)
+    diff = CHALLENGE_DATES_TS[challenge_id] - int(time.time())
     
-    if current_time >= challenge_date:
+    if diff <= 0:
         return None
     
-    time_diff = challenge_date - current_time
-    
-    if time_diff.days > 0:
-        return f"{time_diff.days} día(s)"
-    elif time_diff.seconds > 3600:
-        hours = time_diff.seconds // 3600
-        return f"{hours} hora(s)"
-    elif time_diff.seconds > 60:
-        minutes = time_diff.seconds // 60
-        return f"{minutes} minuto(s)"
+    if diff >= 86400:
+        return f"{diff // 86400} día(s)"
+    elif diff > 3600:
+        return f"{diff // 3600} hora(s)"
+    elif diff > 60:
+        return f"{diff // 60} minuto(s)"
     else:
         return "menos de 1 minuto"
 
+# ==================== CACHÉS DE RESPUESTAS ====================
+# Cachés cortos para absorber ráfagas de botones concurrentes
+# (el ranking se cachea directamente en Database.get_leaderboard)
+AVAILABILITY_CACHE_TTL = 30
+_availability_cache = {'t': 0.0, 'v': None}
+
+def get_challenges_availability():
+    """Obtiene (id, desafío, disponible, fecha) de cada desafío, cacheado por unos segundos"""
+    if _availability_cache['v'] and time.monotonic() - _availability_cache['t'] < AVAILABILITY_CACHE_TTL:
+        return _availability_cache['v']
+    availability = tuple(
+        (challenge_id, challenge, is_challenge_available(challenge_id),
+         get_challenge_availability_date(challenge_id).strftime('%d/%m'))
+        for challenge_id, challenge in CHALLENGES.items()
+    )
+    _availability_cache.update(t=time.monotonic(), v=availability)
+    return availability
+
 def track_activity(func):
     """Decorator para registrar actividad del bot"""
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -256,6 +283,44 @@ def track_activity(func):
         return await func(update, context)
     return wrapper
 
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """Atiende chats distintos en paralelo y las actualizaciones de un mismo chat en orden.
+
+    Serializa todo lo que llega de un chat (handlers y cambios de estado del
+    ConversationHandler). Cada lock se descarta cuando ninguna actualización de ese
+    chat lo tiene ni lo espera.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._chat_locks: dict[int, asyncio.Lock] = {}
+        self._chat_lock_users: dict[int, int] = {}
+
+    async def do_process_update(self, update: object, coroutine) -> None:
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            # Sin chat (p. ej. inline queries) no hay orden que preservar
+            await coroutine
+            return
+        chat_id = chat.id
+        # Sin await entre ambas líneas: el lock y su contador se actualizan juntos
+        lock = self._chat_locks.setdefault(chat_id, asyncio.Lock())
+        self._chat_lock_users[chat_id] = self._chat_lock_users.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                await coroutine
+        finally:
+            self._chat_lock_users[chat_id] -= 1
+            if not self._chat_lock_users[chat_id]:
+                del self._chat_lock_users[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
 # ==================== DESAFÍOS ====================
 CHALLENGES = {
     0: {
@@ -374,6 +439,31 @@ Formato de respuesta: `FLAG{DEPOSITO}` o `FLAG{DEPOSITO_DEPOSITO}`
     }
 }
 
+# Títulos indexados por ID de desafío
+CHALLENGE_TITLES = tuple(CHALLENGES[i]['title'] for i in range(len(CHALLENGES)))
+
+# Flags válidas normalizadas a mayúsculas, calculadas una sola vez
+CHALLENGE_FLAGS_UPPER = {
+    cid: frozenset(f.upper() for f in (c['flag'] if isinstance(c['flag'], list) else [c['flag']]))
+    for cid, c in CHALLENGES.items()
+}
+
+# Fechas de desbloqueo como epoch (segundos UTC), calculadas una sola vez
+CHALLENGE_DATES_TS = tuple(int(get_challenge_availability_date(cid).timestamp()) for cid in range(len(CHALLENGES)))
+
+# ==================== TECLADOS ESTÁTICOS ====================
+# Se construyen una sola vez y se reutilizan en cada respuesta
+MAIN_MENU_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📋 Ver Desafíos", callback_data="view_challenges")],
+    [InlineKeyboardButton("📊 Mi Progreso", callback_data="my_progress")],
+    [InlineKeyboardButton("🏆 Ranking", callback_data="leaderboard")]
+])
+
+LEADERBOARD_KB = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📊 Mi Progreso", callback_data="my_progress")],
+    [InlineKeyboardButton("🔙 Menú Principal", callback_data="main_menu")]
+])
+
 # ==================== COMANDOS PRINCIPALES ====================
 @track_activity
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -381,18 +471,11 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_name = sanitize_text(user.first_name)
     
-    keyboard = [
-        [InlineKeyboardButton("📋 Ver Desafíos", callback_data="view_challenges")],
-        [InlineKeyboardButton("📊 Mi Progreso", callback_data="my_progress")],
-        [InlineKeyboardButton("🏆 Ranking", callback_data="leaderboard")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await update.message.reply_text(
         f"🔍 ¡Hola {user_name}! Bienvenido al DIFFYE-CTF Bot 🤖\n\n"
         "Selecciona una opción para comenzar.\n\n"
         "Si es tu primera vez, asegúrate de inscribirte con el comando /register.",
-        reply_markup=reply_markup
+        reply_markup=MAIN_MENU_KB
     )
 
 @track_activity
@@ -430,11 +513,10 @@ async def view_challenges(update: Update, context: ContextTypes.DEFAULT_TYPE):
     completed = progress['completed_challenges'] if progress else []
     text = "📋 DESAFÍOS DISPONIBLES\n" + "="*30 + "\n\n"
     keyboard = []
-    for challenge_id, challenge in CHALLENGES.items():
-        is_available = is_challenge_available(challenge_id)
+    for challenge_id, challenge, is_available, available_date in get_challenges_availability():
         is_completed = challenge_id in completed
         if is_completed: status = "✅ Completado"
-        elif not is_available: status = f"🔒 Disponible el {get_challenge_availability_date(challenge_id).strftime('%d/%m')}"
+        elif not is_available: status = f"🔒 Disponible el {available_date}"
         else: status = "🔓 Disponible ahora"
         text += f"{'✅' if is_completed else '🔒' if not is_available else '🔓'} {challenge['title']} - {status}\n"
         if is_available and not is_completed:
@@ -495,62 +577,57 @@ async def process_flag(update: Update, context: ContextTypes.DEFAULT_TYPE):
     challenge = CHALLENGES[challenge_id]
     flag_list = challenge['flag'] if isinstance(challenge['flag'], list) else [challenge['flag']]
 
-    is_correct = flag.upper() in [f.upper() for f in flag_list]
+    is_correct = flag.upper() in CHALLENGE_FLAGS_UPPER[challenge_id]
 
-    if is_correct:
-        result = await Database.check_flag(user_id, challenge_id, flag_list[0])
-        
-        keyboard = [[InlineKeyboardButton("📋 Ver Desafíos", callback_data="view_challenges")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        if result == 'correct':
-            # Verificar si completó todos los desafíos
-            if challenge_id == 5:  # Desafío 5 es el último (índice 5)
-                # Verificar si ahora tiene todos los desafíos completados
-                progress = await Database.get_user_progress(user_id)
-                if progress and len(progress['completed_challenges']) == 6:
-                    # Enviar mensaje especial y foto
-                    congratulations_text = (
-                        f"✅ ¡FLAG CORRECTA! Has completado {CHALLENGES[challenge_id]['title']}.\n\n"
-                        "🎉 ¡Bien hecho, investigador 🕵️! Tu análisis ha permitido lograr la detención del fugitivo. 🎉"
+    # Una única llamada a la BD por envío: se registra la flag canónica si es correcta
+    submitted_flag = flag_list[0] if is_correct else flag
+    result = await Database.check_flag(user_id, challenge_id, submitted_flag, is_correct)
+    
+    keyboard = [[InlineKeyboardButton("📋 Ver Desafíos", callback_data="view_challenges")]]
+    reply_markup = InlineKeyboardMarkup(keyboard)
+    
+    if result == 'correct':
+        # Verificar si completó todos los desafíos
+        if challenge_id == 5:  # Desafío 5 es el último (índice 5)
+            # Verificar si ahora tiene todos los desafíos completados
+            progress = await Database.get_user_progress(user_id)
+            if progress and len(progress['completed_challenges']) == 6:
+                # Enviar mensaje especial y foto
+                congratulations_text = (
+                    f"✅ ¡FLAG CORRECTA! Has completado {CHALLENGES[challenge_id]['title']}.\n\n"
+                    "🎉 ¡Bien hecho, investigador 🕵️! Tu análisis ha permitido lograr la detención del fugitivo. 🎉"
+                )
+                
+                # Primero enviar el texto
+                await update.message.reply_text(congratulations_text, reply_markup=reply_markup)
+                                    
+                # Luego intentar enviar la imagen
+                try:
+                    await context.bot.send_photo(
+                        chat_id=update.effective_chat.id,
+                        photo=os.os.getenv('IMGFINAL'),
+                        caption="🚔 FUGITIVO CAPTURADO 🚔"
                     )
-                    
-                    # Primero enviar el texto
-                    await update.message.reply_text(congratulations_text, reply_markup=reply_markup)
-                                        
-                    # Luego intentar enviar la imagen
-                    try:
-                        await context.bot.send_photo(
-                            chat_id=update.effective_chat.id,
-                            photo=os.os.getenv('IMGFINAL'),
-                            caption="🚔 FUGITIVO CAPTURADO 🚔"
-                        )
-                    except Exception as e:
-                        logger.error(f"Error enviando imagen desde Drive: {e}")
-                        # Si falla el envío, mostrar mensaje alternativo
-                        await update.message.reply_text(
-                            "🚔 FUGITIVO CAPTURADO 🚔\n"
-                            "(No se pudo cargar la imagen desde Drive)"
-                        )
-                else:
+                except Exception as e:
+                    logger.error(f"Error enviando imagen desde Drive: {e}")
+                    # Si falla el envío, mostrar mensaje alternativo
                     await update.message.reply_text(
-                        f"✅ ¡FLAG CORRECTA! Has completado {CHALLENGES[challenge_id]['title']}.",
-                        reply_markup=reply_markup
+                        "🚔 FUGITIVO CAPTURADO 🚔\n"
+                        "(No se pudo cargar la imagen desde Drive)"
                     )
             else:
                 await update.message.reply_text(
                     f"✅ ¡FLAG CORRECTA! Has completado {CHALLENGES[challenge_id]['title']}.",
                     reply_markup=reply_markup
                 )
-        elif result == 'already_completed':
-            await update.message.reply_text("ℹ️ Ya has completado este desafío.", reply_markup=reply_markup)
         else:
-            await update.message.reply_text("❌ FLAG INCORRECTA. Intenta de nuevo.", reply_markup=reply_markup)
+            await update.message.reply_text(
+                f"✅ ¡FLAG CORRECTA! Has completado {CHALLENGES[challenge_id]['title']}.",
+                reply_markup=reply_markup
+            )
+    elif result == 'already_completed' and is_correct:
+        await update.message.reply_text("ℹ️ Ya has completado este desafío.", reply_markup=reply_markup)
     else:
-        # Registrar intento fallido usando check_flag que ya maneja los intentos
-        await Database.check_flag(user_id, challenge_id, flag)
-        keyboard = [[InlineKeyboardButton("📋 Ver Desafíos", callback_data="view_challenges")]]
-        reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text("❌ FLAG INCORRECTA. Intenta de nuevo.", reply_markup=reply_markup)
     
     context.user_data.pop('submitting_challenge', None)
@@ -571,7 +648,7 @@ async def my_progress(update: Update, context: ContextTypes.DEFAULT_TYPE):
         completed = progress['completed_challenges']
         
         username = sanitize_text(stats['username'])
-        last_activity = stats['last_activity'].strftime('%d/%m %H:%M')
+        last_activity = stats['last_activity'].astimezone(TZ).strftime('%d/%m %H:%M')
         
         text = f"📊 MI PROGRESO\n" + "="*30 + "\n\n"
         text += f"👤 Usuario: {username}\n"
@@ -608,49 +685,39 @@ async def leaderboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     # Ordenar por desafíos completados (desc) y luego por intentos (asc)
     if ranking:
-        ranking.sort(key=lambda x: (-x['challenges_completed'], x['total_attempts']))
+        ranking = sorted(ranking, key=lambda x: (-x['challenges_completed'], x['total_attempts']))
     
-    text = "🏆 RANKING TOP 10\n" + "="*30 + "\n\n"
+    parts = ["🏆 RANKING TOP 10\n" + "="*30 + "\n\n"]
     
     if not ranking:
-        text += "Aún no hay usuarios en el ranking.\n"
+        parts.append("Aún no hay usuarios en el ranking.\n")
     else:
         medals = ["🥇", "🥈", "🥉"]
         for i, user in enumerate(ranking[:10]):  # Limitar a top 10
             medal = medals[i] if i < 3 else f"{i+1}."
-            full_name = sanitize_text(user['full_name']) 
-            text += f"{medal} {full_name}\n"  
-            text += f"   ✅ Desafíos: {user['challenges_completed']}/6\n"
-            text += f"   🎯 Intentos: {user['total_attempts']}\n\n"
-    
-    keyboard = [
-        [InlineKeyboardButton("📊 Mi Progreso", callback_data="my_progress")],
-        [InlineKeyboardButton("🔙 Menú Principal", callback_data="main_menu")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
+            full_name = sanitize_text(user['full_name'])
+            parts.append(
+                f"{medal} {full_name}\n"
+                f"   ✅ Desafíos: {user['challenges_completed']}/6\n"
+                f"   🎯 Intentos: {user['total_attempts']}\n\n"
+            )
+    text = "".join(parts)
     
     if query:
         await query.answer()
-        await query.edit_message_text(text=text, reply_markup=reply_markup)
+        await query.edit_message_text(text=text, reply_markup=LEADERBOARD_KB)
     else:
-        await message.reply_text(text=text, reply_markup=reply_markup)
+        await message.reply_text(text=text, reply_markup=LEADERBOARD_KB)
 
 async def main_menu(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Muestra el menú principal"""
     query = update.callback_query
     
-    keyboard = [
-        [InlineKeyboardButton("📋 Ver Desafíos", callback_data="view_challenges")],
-        [InlineKeyboardButton("📊 Mi Progreso", callback_data="my_progress")],
-        [InlineKeyboardButton("🏆 Ranking", callback_data="leaderboard")]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
     await query.answer()
     await query.edit_message_text(
         "🔍 DIFFYE-CTF Bot\n\n"
         "Selecciona una opción del menú:",
-        reply_markup=reply_markup
+        reply_markup=MAIN_MENU_KB
     )
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -701,20 +768,21 @@ async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
     try:
         stats = await Database.get_admin_stats()
         
+        total_users = stats['total_users']
+        
         text = "📊 ESTADÍSTICAS ADMINISTRATIVAS\n" + "="*40 + "\n\n"
-        text += f"👥 Usuarios Totales: {stats['total_users']}\n"
+        text += f"👥 Usuarios Totales: {total_users}\n"
         text += f"🔥 Activos (24h): {stats['active_users']}\n\n"
         
         text += "📈 COMPLETADOS POR DESAFÍO:\n" + "-"*30 + "\n"
         
-        # Ordenar estadísticas por ID de desafío
-        challenge_stats = sorted(stats['challenge_stats'], key=lambda x: x['challenge_id'])
-        
-        for stat in challenge_stats:
-            challenge_name = CHALLENGES[stat['challenge_id']]['title']
-            completion_rate = (stat['completions'] / stats['total_users'] * 100) if stats['total_users'] > 0 else 0
-            text += f"• {challenge_name}:\n"
-            text += f"  Completados: {stat['completions']} usuarios ({completion_rate:.1f}%)\n\n"
+        # challenge_stats ya viene ordenado por ID de desafío
+        text += "".join(
+            f"• {CHALLENGE_TITLES[stat['challenge_id']]}:\n"
+            f"  Completados: {stat['completions']} usuarios "
+            f"({(stat['completions'] / total_users * 100) if total_users > 0 else 0:.1f}%)\n\n"
+            for stat in stats['challenge_stats']
+        )
         
         # Agregar estadísticas adicionales
         if stats.get('completion_stats'):
@@ -858,7 +926,7 @@ async def confirm_broadcast(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Maneja los errores del bot"""
-    logger.error(f"Update {update} caused error {context.error}")
+    logger.error("Update %s caused error", update, exc_info=context.error)
     
     if update and update.effective_message:
         await update.effective_message.reply_text(
@@ -868,8 +936,15 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def post_init_tasks(application: Application):
     """Función de inicialización asíncrona para la base de datos"""
+    # Servidor web de keep-alive en el event loop del bot (sin hilos aparte)
+    await web_server.start()
+    
     await db_manager.initialize()
-    await Database.init_db()
+    # El esquema se crea solo si falta (o explícitamente con: python -m setup_optimized)
+    if await Database.is_schema_ready():
+        logger.info("Esquema de base de datos existente, se omite init_db")
+    else:
+        await Database.init_db()
     logger.info("Base de datos inicializada correctamente")
     
     # Iniciar el servicio de keep-alive
@@ -878,21 +953,34 @@ async def post_init_tasks(application: Application):
 async def post_shutdown_tasks(application: Application):
     """Función para cerrar la conexión de la base de datos"""
     await keep_alive_service.stop()
+    await web_server.stop()
     await db_manager.close()
     logger.info("Conexión de la base de datos cerrada")
 
+def install_uvloop():
+    """Usa uvloop como event loop si está disponible (no soportado en Windows)"""
+    if sys.platform == 'win32':
+        return
+    try:
+        import uvloop
+    except ImportError:
+        logger.info("uvloop no instalado, se usa el event loop por defecto de asyncio")
+        return
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    logger.info("⚡ Event loop: uvloop")
+
 def main() -> None:
     """Función principal del bot"""
 
-    # Iniciar el servidor web en un hilo separado para el keep-alive
-    web_server_thread = threading.Thread(target=start_web_server)
-    web_server_thread.daemon = True
-    web_server_thread.start()
-    
+    # Instalar uvloop antes de que la aplicación cree el event loop
+    install_uvloop()
+
     # Crear la aplicación del bot
     application = (
         Application.builder()
         .token(BOT_TOKEN)
+        # Hasta 256 actualizaciones a la vez (el valor de concurrent_updates(True)), en orden por chat
+        .concurrent_updates(PerChatUpdateProcessor(256))
         .post_init(post_init_tasks)
         .post_shutdown(post_shutdown_tasks)
         .build()
@@ -8,8 +8,9 @@ Optimizado para DIFFYE-CTF Bot
 import asyncpg
 import asyncio
 import logging
-from contextlib import asynccontextmanager
-from typing import Dict, List, Optional, Tuple, AsyncGenerator
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
 import os
 from dotenv import load_dotenv
 
@@ -18,12 +19,20 @@ load_dotenv()
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
-    """Manejador de base de datos con pool de conexiones"""
+    """Manejador de base de datos con pool de conexiones.
 
-    def __init__(self, database_url: str, min_connections: int = 1, max_connections: int = 2):
+    Los métodos execute_* usan directamente pool.fetch/fetchrow/execute (requieren
+    initialize()) y no capturan excepciones: las registran los métodos de Database
+    o el error_handler del bot.
+    """
+
+    def __init__(self, database_url: str, min_connections: int = 5, max_connections: int = 20,
+                 statement_cache_size: int = 100):
         self.database_url = database_url
         self.min_connections = min_connections
         self.max_connections = max_connections
+        # 0 solo si hay PgBouncer en modo transaction delante de la BD
+        self.statement_cache_size = statement_cache_size
         self.pool: Optional[asyncpg.Pool] = None
 
     async def initialize(self):
@@ -34,10 +43,12 @@ class DatabaseManager:
                 min_size=self.min_connections,
                 max_size=self.max_connections,
                 command_timeout=30,
-                statement_cache_size=0,
+                max_queries=50000,
+                max_inactive_connection_lifetime=300,
+                statement_cache_size=self.statement_cache_size,
+                # La zona horaria se aplica al mostrar los datos (columnas TIMESTAMPTZ)
                 server_settings={
-                    'application_name': 'diffye_ctf_bot',
-                    'timezone': 'America/Argentina/Buenos_Aires'
+                    'application_name': 'diffye_ctf_bot'
                 }
             )
             logger.info(f"✅ Pool de conexiones asíncrono inicializado: {self.min_connections}-{self.max_connections}")
@@ -52,47 +63,31 @@ class DatabaseManager:
             logger.info("✅ Pool de conexiones asíncrono cerrado")
             self.pool = None
 
-    @asynccontextmanager
-    async def get_connection(self) -> AsyncGenerator[asyncpg.Connection, None]:
-        """Context manager para obtener una conexión del pool"""
+    def _require_pool(self) -> asyncpg.Pool:
+        """Devuelve el pool o falla con un error claro si aún no se llamó a initialize()"""
         if not self.pool:
             raise RuntimeError("Pool no inicializado. Llama a initialize() primero.")
-        
-        connection = await self.pool.acquire()
-        try:
-            yield connection
-        finally:
-            await self.pool.release(connection)
+        return self.pool
 
-    async def execute_query(self, query: str, *args) -> List[Dict]:
-        """Ejecuta una consulta SELECT y retorna los resultados"""
-        try:
-            async with self.get_connection() as conn:
-                rows = await conn.fetch(query, *args)
-                return [dict(row) for row in rows]
-        except Exception as e:
-            logger.error(f"Error ejecutando consulta: {e}")
-            raise
+    def get_connection(self):
+        """Obtiene una conexión del pool para usar con `async with` (devuelve pool.acquire())"""
+        return self._require_pool().acquire()
 
-    async def execute_one(self, query: str, *args) -> Optional[Dict]:
-        """Ejecuta una consulta SELECT y retorna un solo resultado"""
-        try:
-            async with self.get_connection() as conn:
-                row = await conn.fetchrow(query, *args)
-                return dict(row) if row else None
-        except Exception as e:
-            logger.error(f"Error ejecutando consulta: {e}")
-            raise
+    async def execute_query(self, query: str, *args) -> List[asyncpg.Record]:
+        """Ejecuta una consulta SELECT y retorna los resultados (Records, sin copiar a dict)"""
+        return await self._require_pool().fetch(query, *args)
+
+    async def execute_one(self, query: str, *args) -> Optional[asyncpg.Record]:
+        """Ejecuta una consulta SELECT y retorna un solo resultado (Record o None)"""
+        return await self._require_pool().fetchrow(query, *args)
 
     async def execute_command(self, query: str, *args) -> str:
         """Ejecuta un comando (INSERT, UPDATE, DELETE) y retorna el resultado"""
-        try:
-            async with self.get_connection() as conn:
-                result = await conn.execute(query, *args)
-                return result
-        except Exception as e:
-            logger.error(f"Error ejecutando comando: {e}")
-            raise
+        return await self._require_pool().execute(query, *args)
+
+    async def execute_many(self, query: str, args_list: List[tuple]) -> None:
+        """Ejecuta un mismo comando para muchas filas en un solo intercambio (executemany)"""
+        await self._require_pool().executemany(query, args_list)
 
     async def execute_transaction(self, queries: List[Tuple[str, tuple]]) -> bool:
         """Ejecuta múltiples consultas en una transacción"""
@@ -109,261 +104,477 @@ class DatabaseManager:
 # Instancia global del manejador de base de datos
 db_manager = DatabaseManager(
     database_url=os.getenv('DATABASE_URL'),
-    min_connections=int(os.getenv('DB_MIN_CONNECTIONS', '1')),
-    max_connections=int(os.getenv('DB_MAX_CONNECTIONS', '3'))
+    min_connections=int(os.getenv('DB_MIN_CONNECTIONS', '5')),
+    max_connections=int(os.getenv('DB_MAX_CONNECTIONS', '20')),
+    statement_cache_size=int(os.getenv('DB_STATEMENT_CACHE_SIZE', '100'))
 )
 
+async def parallel(*coros):
+    """Ejecuta consultas independientes en paralelo.
+
+    Cada execute_* del manejador toma su propia conexión del pool (una conexión no
+    admite consultas simultáneas), así que el tiempo total es el de la más lenta.
+    """
+    return await asyncio.gather(*coros)
+
+# Cachés en memoria para consultas agregadas costosas
+LEADERBOARD_CACHE_TTL = int(os.getenv('LEADERBOARD_CACHE_TTL', '60'))
+ADMIN_STATS_CACHE_TTL = int(os.getenv('ADMIN_STATS_CACHE_TTL', '30'))
+
+def async_ttl_cache(seconds: int):
+    """Decorator que cachea el resultado de una corrutina sin argumentos durante `seconds` segundos.
+
+    El lock evita que varias corrutinas consulten a la vez cuando el caché expira;
+    los errores no se cachean. Expone `invalidate()` para descartar el valor.
+    """
+    def decorator(func):
+        # El lock se crea en la primera llamada: en Python < 3.10 asyncio.Lock() se ata al
+        # event loop vigente al crearlo, y al importar el módulo aún no existe el definitivo
+        cache = {'data': None, 'expires': 0.0, 'generation': 0, 'lock': None}
+
+        async def wrapper():
+            if time.monotonic() < cache['expires']:
+                return cache['data']
+            if cache['lock'] is None:
+                cache['lock'] = asyncio.Lock()
+            async with cache['lock']:
+                # Otra corrutina pudo haberlo refrescado mientras esperábamos el lock
+                if time.monotonic() < cache['expires']:
+                    return cache['data']
+                generation = cache['generation']
+                data = await func()
+                # Si se invalidó durante la consulta, el resultado ya puede estar desactualizado:
+                # se devuelve pero no se da por vigente
+                if cache['generation'] == generation:
+                    cache['data'] = data
+                    cache['expires'] = time.monotonic() + seconds
+                return data
+
+        def invalidate():
+            cache['generation'] += 1
+            cache['expires'] = 0.0
+
+        wrapper.invalidate = invalidate
+        return wrapper
+    return decorator
+
+# Sentencias del camino caliente. Con el caché de sentencias de asyncpg activo, cada
+# conexión las prepara una vez y reutiliza el plan; el texto debe mantenerse idéntico.
+
+# Verifica y registra un envío de flag ($1 user_id, $2 challenge_id, $3 flag, $4 is_correct)
+CHECK_FLAG_SQL = '''
+    WITH existing AS (
+        SELECT 1 FROM progress
+        WHERE user_id = $1 AND challenge_id = $2 AND is_correct = TRUE
+    ),
+    ins AS (
+        INSERT INTO progress (user_id, challenge_id, flag_submitted, is_correct)
+        SELECT $1::BIGINT, $2::INTEGER, $3::VARCHAR, $4::BOOLEAN
+        WHERE NOT EXISTS (SELECT 1 FROM existing)
+        ON CONFLICT (user_id, challenge_id, flag_submitted) DO NOTHING
+    ),
+    upd AS (
+        UPDATE statistics
+        SET challenges_completed = CASE WHEN $4::BOOLEAN THEN (
+                SELECT COUNT(DISTINCT challenge_id)
+                FROM progress
+                WHERE user_id = $1 AND is_correct = TRUE
+            ) + 1 ELSE challenges_completed END,
+            total_attempts = total_attempts + 1,
+            correct_attempts = correct_attempts + CASE WHEN $4::BOOLEAN THEN 1 ELSE 0 END,
+            incorrect_attempts = incorrect_attempts + CASE WHEN $4::BOOLEAN THEN 0 ELSE 1 END,
+            first_correct_at = CASE WHEN $4::BOOLEAN
+                THEN COALESCE(first_correct_at, CURRENT_TIMESTAMP)
+                ELSE first_correct_at END,
+            last_activity = CURRENT_TIMESTAMP
+        WHERE user_id = $1 AND NOT EXISTS (SELECT 1 FROM existing)
+    )
+    SELECT EXISTS (SELECT 1 FROM existing) AS already_completed
+'''
+
+# Alta/actualización del usuario y su fila de estadísticas en una sola sentencia
+UPSERT_USER_SQL = '''
+    WITH u AS (
+        INSERT INTO users (user_id, username, full_name)
+        VALUES ($1, $2, $3)
+        ON CONFLICT (user_id) DO UPDATE
+        SET username = EXCLUDED.username,
+            full_name = EXCLUDED.full_name,
+            is_active = TRUE
+        RETURNING user_id
+    )
+    INSERT INTO statistics (user_id)
+    SELECT user_id FROM u
+    ON CONFLICT (user_id) DO NOTHING
+'''
+
+# Estadísticas y desafíos completados de un usuario en una sola consulta ($1 user_id)
+USER_PROGRESS_SQL = '''
+    SELECT s.*, u.username, u.full_name,
+           COALESCE(
+               array_agg(DISTINCT p.challenge_id ORDER BY p.challenge_id)
+                   FILTER (WHERE p.is_correct),
+               '{}'
+           ) AS completed
+    FROM statistics s
+    JOIN users u ON s.user_id = u.user_id
+    LEFT JOIN progress p ON p.user_id = s.user_id
+    WHERE s.user_id = $1
+    GROUP BY s.user_id, u.username, u.full_name
+'''
+
+# Usuarios que aparecen en el ranking
+LEADERBOARD_COUNT_SQL = '''
+    SELECT COUNT(*) AS total
+    FROM statistics
+    WHERE challenges_completed > 0
+'''
+
+# Resultado de Database.run_test_fixture
+TestFixtureResult = namedtuple('TestFixtureResult', ['flag_result', 'progress', 'leaderboard_count'])
+
 class Database:
     """Clase de compatibilidad con el código existente"""
     
     @staticmethod
     async def init_db():
         """Inicializa las tablas de la base de datos"""
-        queries = [
-            # ... Consultas SQL para crear tablas
-            ('''
+        statements = [
+            # Consultas SQL para crear tablas e índices
+            '''
                 CREATE TABLE IF NOT EXISTS users (
                     user_id BIGINT PRIMARY KEY,
                     username VARCHAR(255),
                     full_name VARCHAR(255),
-                    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    registration_date TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
                     is_active BOOLEAN DEFAULT TRUE,
                     email VARCHAR(255),
                     phone VARCHAR(50),
                     organization VARCHAR(255)
                 )
-            ''', ()),
-            ('''
+            ''',
+            '''
                 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username)
-            ''', ()),
-            ('''
+            ''',
+            '''
                 CREATE INDEX IF NOT EXISTS idx_users_active ON users(is_active)
-            ''', ()),
-            ('''
+            ''',
+            '''
                 CREATE TABLE IF NOT EXISTS progress (
                     id SERIAL PRIMARY KEY,
                     user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
                     challenge_id INTEGER NOT NULL,
                     flag_submitted VARCHAR(255) NOT NULL,
                     is_correct BOOLEAN NOT NULL,
-                    submission_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    submission_date TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
                     ip_address INET,
                     attempt_number INTEGER DEFAULT 1,
                     UNIQUE(user_id, challenge_id, flag_submitted)
                 )
-            ''', ()),
-            ('''
+            ''',
+            '''
                 CREATE INDEX IF NOT EXISTS idx_progress_user ON progress(user_id)
-            ''', ()),
-            ('''
+            ''',
+            '''
                 CREATE INDEX IF NOT EXISTS idx_progress_challenge ON progress(challenge_id)
-            ''', ()),
-            ('''
+            ''',
+            '''
                 CREATE INDEX IF NOT EXISTS idx_progress_correct ON progress(is_correct)
-            ''', ()),
-            ('''
+            ''',
+            '''
                 CREATE INDEX IF NOT EXISTS idx_progress_date ON progress(submission_date)
-            ''', ()),
-            ('''
+            ''',
+            # Índices parciales para las consultas sobre respuestas correctas
+            '''
+                CREATE INDEX IF NOT EXISTS idx_progress_user_correct_chal
+                ON progress(user_id, challenge_id) WHERE is_correct = TRUE
+            ''',
+            '''
+                CREATE INDEX IF NOT EXISTS idx_progress_correct_challenge
+                ON progress(challenge_id) WHERE is_correct = TRUE
+            ''',
+            '''
                 CREATE TABLE IF NOT EXISTS statistics (
                     user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
                     challenges_completed INTEGER DEFAULT 0,
                     total_attempts INTEGER DEFAULT 0,
                     correct_attempts INTEGER DEFAULT 0,
                     incorrect_attempts INTEGER DEFAULT 0,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    last_activity TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
                     total_time_minutes INTEGER DEFAULT 0,
                     average_attempts_per_challenge DECIMAL(5,2) DEFAULT 0,
+                    first_correct_at TIMESTAMPTZ,
                     PRIMARY KEY (user_id)
                 )
-            ''', ()),
-            ('''
+            ''',
+            # Primera respuesta correcta desnormalizada para ordenar el ranking sin agregaciones
+            '''
+                ALTER TABLE statistics ADD COLUMN IF NOT EXISTS first_correct_at TIMESTAMPTZ
+            ''',
+            # Migra columnas TIMESTAMP antiguas (guardadas en hora de Buenos Aires) a TIMESTAMPTZ
+            '''
+                DO $$
+                DECLARE col RECORD;
+                BEGIN
+                    FOR col IN
+                        SELECT table_name, column_name
+                        FROM information_schema.columns
+                        WHERE table_schema = current_schema()
+                          AND table_name IN ('users', 'progress', 'statistics', 'activity_logs')
+                          AND data_type = 'timestamp without time zone'
+                    LOOP
+                        EXECUTE format(
+                            'ALTER TABLE %I ALTER COLUMN %I TYPE TIMESTAMPTZ USING %I AT TIME ZONE %L',
+                            col.table_name, col.column_name, col.column_name,
+                            'America/Argentina/Buenos_Aires'
+                        );
+                    END LOOP;
+                END $$
+            ''',
+            '''
+                UPDATE statistics s
+                SET first_correct_at = p.first_correct
+                FROM (
+                    SELECT user_id, MIN(submission_date) AS first_correct
+                    FROM progress
+                    WHERE is_correct = TRUE
+                    GROUP BY user_id
+                ) p
+                WHERE s.user_id = p.user_id AND s.first_correct_at IS NULL
+            ''',
+            '''
+                CREATE INDEX IF NOT EXISTS idx_stats_rank
+                ON statistics(challenges_completed DESC, first_correct_at ASC)
+            ''',
+            '''
                 CREATE TABLE IF NOT EXISTS activity_logs (
                     id SERIAL PRIMARY KEY,
                     user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
                     action VARCHAR(100) NOT NULL,
                     details TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    timestamp TIMESTAMPTZ DEFAULT CURRENT_TIMESTAMP,
                     ip_address INET
                 )
-            ''', ()),
-            ('''
+            ''',
+            '''
                 CREATE INDEX IF NOT EXISTS idx_activity_user ON activity_logs(user_id)
-            ''', ()),
-            ('''
+            ''',
+            '''
                 CREATE INDEX IF NOT EXISTS idx_activity_timestamp ON activity_logs(timestamp)
-            ''', ()),
-            ('''
+            ''',
+            '''
                 CREATE INDEX IF NOT EXISTS idx_activity_action ON activity_logs(action)
-            ''', ())
+            ''',
         ]
         
-        success = await db_manager.execute_transaction(queries)
-        if success:
-            logger.info("Base de datos inicializada correctamente")
-        else:
-            logger.error("Error inicializando base de datos")
-        return success
+        # Todo el DDL se envía en un único execute (sin parámetros) dentro de una transacción
+        ddl = ";\n".join(statements)
+        try:
+            async with db_manager.get_connection() as conn:
+                async with conn.transaction():
+                    await conn.execute(ddl)
+        except Exception as e:
+            logger.error(f"Error inicializando base de datos: {e}")
+            return False
+        
+        logger.info("Base de datos inicializada correctamente")
+        return True
+    
+    @staticmethod
+    async def is_schema_ready() -> bool:
+        """Indica si el esquema ya está creado, para no re-ejecutar el DDL en cada arranque"""
+        # init_db aplica todo el DDL en una transacción; idx_stats_rank y la ausencia de columnas
+        # TIMESTAMP sin zona reflejan lo más reciente del esquema. Al agregar DDL nuevo,
+        # actualizar esta verificación.
+        row = await db_manager.execute_one('''
+            SELECT to_regclass('users') IS NOT NULL
+               AND to_regclass('progress') IS NOT NULL
+               AND to_regclass('statistics') IS NOT NULL
+               AND to_regclass('activity_logs') IS NOT NULL
+               AND to_regclass('idx_stats_rank') IS NOT NULL
+               AND NOT EXISTS (
+                   SELECT 1 FROM information_schema.columns
+                   WHERE table_schema = current_schema()
+                     AND table_name IN ('users', 'progress', 'statistics', 'activity_logs')
+                     AND data_type = 'timestamp without time zone'
+               ) AS ready
+        ''')
+        return bool(row['ready'])
     
     @staticmethod
     async def register_user(user_id: int, username: str, full_name: str) -> bool:
         """Registra un nuevo usuario"""
-        queries = [
-            ('''
-                INSERT INTO users (user_id, username, full_name)
-                VALUES ($1, $2, $3)
-                ON CONFLICT (user_id) DO UPDATE
-                SET username = EXCLUDED.username,
-                    full_name = EXCLUDED.full_name,
-                    is_active = TRUE
-            ''', (user_id, username, full_name)),
-            ('''
-                INSERT INTO statistics (user_id)
-                VALUES ($1)
-                ON CONFLICT (user_id) DO NOTHING
-            ''', (user_id,))
-        ]
-        
-        return await db_manager.execute_transaction(queries)
+        try:
+            await db_manager.execute_command(UPSERT_USER_SQL, user_id, username, full_name)
+            return True
+        except Exception as e:
+            logger.error(f"Error registrando usuario: {e}")
+            return False
     
     @staticmethod
-    async def check_flag(user_id: int, challenge_id: int, flag: str) -> str:
-        """Verifica una flag enviada por el usuario"""
+    def _is_correct_flag(challenge_id: int, flag: str) -> bool:
+        """Compara la flag (sin distinguir mayúsculas) con las aceptadas para el desafío"""
+        # Import diferido: bot importa este módulo
+        from bot import CHALLENGE_FLAGS_UPPER
+        return flag.upper() in CHALLENGE_FLAGS_UPPER[challenge_id]
+    
+    @staticmethod
+    def _flag_result(row: asyncpg.Record, is_correct: bool) -> str:
+        """Traduce la fila de CHECK_FLAG_SQL al resultado del envío"""
+        if row['already_completed']:
+            return 'already_completed'
+        return 'correct' if is_correct else 'incorrect'
+    
+    @staticmethod
+    def _progress_result(row: Optional[asyncpg.Record]) -> Dict:
+        """Arma el progreso del usuario a partir de la fila de USER_PROGRESS_SQL"""
+        return {
+            'stats': row,
+            'completed_challenges': list(row['completed']) if row else []
+        }
+    
+    @staticmethod
+    async def check_flag(user_id: int, challenge_id: int, flag: str,
+                         is_correct: Optional[bool] = None) -> str:
+        """Verifica una flag enviada por el usuario (is_correct si el llamador ya la validó)"""
         try:
-            # Verificar si ya completó este desafío
-            existing = await db_manager.execute_one('''
-                SELECT * FROM progress 
-                WHERE user_id = $1 AND challenge_id = $2 AND is_correct = TRUE
-            ''', user_id, challenge_id)
+            if is_correct is None:
+                is_correct = Database._is_correct_flag(challenge_id, flag)
             
-            if existing:
-                return 'already_completed'
+            # Una sola sentencia (atómica): si el desafío no estaba completado,
+            # registra el intento y actualiza las estadísticas
+            row = await db_manager.execute_one(CHECK_FLAG_SQL, user_id, challenge_id, flag, is_correct)
             
-            # Obtener la flag correcta 
-            from bot import CHALLENGES
-            challenge_flags = CHALLENGES[challenge_id]['flag']
-
-            # Manejar tanto listas como strings
-            if isinstance(challenge_flags, list):
-                is_correct = flag.upper() in [f.upper() for f in challenge_flags]
-            else:
-                is_correct = challenge_flags.upper() == flag.upper()
+            result = Database._flag_result(row, is_correct)
+            if result == 'correct':
+                Database.invalidate_leaderboard()
             
-            # Registrar el intento
-            await db_manager.execute_command('''
-                INSERT INTO progress (user_id, challenge_id, flag_submitted, is_correct)
-                VALUES ($1, $2, $3, $4)
-                ON CONFLICT (user_id, challenge_id, flag_submitted) DO NOTHING
-            ''', user_id, challenge_id, flag, is_correct)
-            
-            # Actualizar estadísticas
-            if is_correct:
-                await db_manager.execute_command('''
-                    UPDATE statistics 
-                    SET challenges_completed = (
-                        SELECT COUNT(DISTINCT challenge_id) 
-                        FROM progress 
-                        WHERE user_id = $1 AND is_correct = TRUE
-                    ),
-                    total_attempts = total_attempts + 1,
-                    correct_attempts = correct_attempts + 1,
-                    last_activity = CURRENT_TIMESTAMP
-                    WHERE user_id = $1
-                ''', user_id)
-            else:
-                await db_manager.execute_command('''
-                    UPDATE statistics 
-                    SET total_attempts = total_attempts + 1,
-                        incorrect_attempts = incorrect_attempts + 1,
-                        last_activity = CURRENT_TIMESTAMP
-                    WHERE user_id = $1
-                ''', user_id)
-            
-            return 'correct' if is_correct else 'incorrect'
+            return result
             
         except Exception as e:
             logger.error(f"Error verificando flag: {e}")
             return 'error'
     
+    @staticmethod
+    async def run_test_fixture(user_id: int, username: str, full_name: str,
+                               challenge_id: int, flag: str) -> TestFixtureResult:
+        """Recorre registro, envío de flag, progreso y ranking en una conexión y una transacción.
+
+        La transacción se revierte al final, así que el fixture no deja datos y puede
+        repetirse. Los errores se propagan al llamador.
+        """
+        is_correct = Database._is_correct_flag(challenge_id, flag)
+        
+        async with db_manager.get_connection() as conn:
+            transaction = conn.transaction()
+            await transaction.start()
+            try:
+                await conn.execute(UPSERT_USER_SQL, user_id, username, full_name)
+                row = await conn.fetchrow(CHECK_FLAG_SQL, user_id, challenge_id, flag, is_correct)
+                progress = await conn.fetchrow(USER_PROGRESS_SQL, user_id)
+                leaderboard_count = await conn.fetchval(LEADERBOARD_COUNT_SQL)
+            finally:
+                await transaction.rollback()
+        
+        return TestFixtureResult(
+            flag_result=Database._flag_result(row, is_correct),
+            progress=Database._progress_result(progress),
+            leaderboard_count=leaderboard_count
+        )
+    
     @staticmethod
     async def get_user_progress(user_id: int) -> Dict:
         """Obtiene el progreso del usuario"""
         try:
-            stats = await db_manager.execute_one('''
-                SELECT s.*, u.username, u.full_name
-                FROM statistics s
-                JOIN users u ON s.user_id = u.user_id
-                WHERE s.user_id = $1
-            ''', user_id)
-            
-            completed = await db_manager.execute_query('''
-                SELECT DISTINCT challenge_id
-                FROM progress
-                WHERE user_id = $1 AND is_correct = TRUE
-                ORDER BY challenge_id
-            ''', user_id)
-            
-            return {
-                'stats': stats,
-                'completed_challenges': [row['challenge_id'] for row in completed]
-            }
+            # Estadísticas y desafíos completados en una sola consulta
+            row = await db_manager.execute_one(USER_PROGRESS_SQL, user_id)
+            return Database._progress_result(row)
             
         except Exception as e:
             logger.error(f"Error obteniendo progreso: {e}")
             return {'stats': None, 'completed_challenges': []}
     
     @staticmethod
-    async def get_leaderboard() -> List[Dict]:
-        """Obtiene el ranking de usuarios"""
+    async def get_leaderboard() -> List[asyncpg.Record]:
+        """Obtiene el ranking de usuarios (cacheado durante LEADERBOARD_CACHE_TTL segundos)"""
         try:
-            return await db_manager.execute_query('''
-
-                SELECT u.full_name, s.challenges_completed, s.total_attempts,
-                        MIN(p.submission_date) as first_completion
-                FROM users u
-                JOIN statistics s ON u.user_id = s.user_id
-                LEFT JOIN progress p ON u.user_id = p.user_id AND p.is_correct = TRUE
-                WHERE s.challenges_completed > 0
-                GROUP BY u.full_name, s.challenges_completed, s.total_attempts
-                ORDER BY s.challenges_completed DESC, first_completion ASC
-                LIMIT 10
-            ''')
+            return await Database._fetch_leaderboard()
         except Exception as e:
             logger.error(f"Error obteniendo leaderboard: {e}")
             return []
-    
+
+    @staticmethod
+    @async_ttl_cache(LEADERBOARD_CACHE_TTL)
+    async def _fetch_leaderboard() -> List[asyncpg.Record]:
+        """Consulta el ranking en la base de datos"""
+        return await db_manager.execute_query('''
+            SELECT u.full_name, s.challenges_completed, s.total_attempts,
+                    s.first_correct_at as first_completion
+            FROM users u
+            JOIN statistics s ON u.user_id = s.user_id
+            WHERE s.challenges_completed > 0
+            ORDER BY s.challenges_completed DESC, s.first_correct_at ASC
+            LIMIT 10
+        ''')
+
+    @staticmethod
+    async def get_leaderboard_count() -> int:
+        """Cuenta los usuarios que aparecen en el ranking sin traer sus filas"""
+        try:
+            row = await db_manager.execute_one(LEADERBOARD_COUNT_SQL)
+            return row['total']
+        except Exception as e:
+            logger.error(f"Error contando leaderboard: {e}")
+            return 0
+
+    @staticmethod
+    def invalidate_leaderboard():
+        """Descarta el ranking cacheado para que la próxima consulta lo recalcule"""
+        Database._fetch_leaderboard.invalidate()
+
     
     @staticmethod
     async def get_admin_stats() -> Dict:
-        """Obtiene estadísticas para administradores"""
+        """Obtiene estadísticas para administradores (cacheadas durante ADMIN_STATS_CACHE_TTL segundos)"""
         try:
-            total_users = await db_manager.execute_one(
-                "SELECT COUNT(*) as total FROM users WHERE is_active = TRUE"
-            )
-            
-            active_users = await db_manager.execute_one('''
-                SELECT COUNT(DISTINCT user_id) as active 
-                FROM progress 
+            return await Database._fetch_admin_stats()
+        except Exception as e:
+            logger.error(f"Error obteniendo estadísticas admin: {e}")
+            return {'total_users': 0, 'active_users': 0, 'challenge_stats': []}
+    
+    @staticmethod
+    @async_ttl_cache(ADMIN_STATS_CACHE_TTL)
+    async def _fetch_admin_stats() -> Dict:
+        """Consulta los totales de administración en una sola sentencia"""
+        row = await db_manager.execute_one('''
+            WITH t AS (
+                SELECT COUNT(*) AS total FROM users WHERE is_active = TRUE
+            ),
+            a AS (
+                SELECT COUNT(DISTINCT user_id) AS active
+                FROM progress
                 WHERE submission_date > CURRENT_TIMESTAMP - INTERVAL '24 hours'
-            ''')
-            
-            challenge_stats = await db_manager.execute_query('''
-                SELECT challenge_id, COUNT(DISTINCT user_id) as completions
+            ),
+            c AS (
+                SELECT challenge_id, COUNT(DISTINCT user_id) AS completions
                 FROM progress
                 WHERE is_correct = TRUE
                 GROUP BY challenge_id
-                ORDER BY challenge_id
-            ''')
-            
-            return {
-                'total_users': total_users['total'] if total_users else 0,
-                'active_users': active_users['active'] if active_users else 0,
-                'challenge_stats': challenge_stats
-            }
-            
-        except Exception as e:
-            logger.error(f"Error obteniendo estadísticas admin: {e}")
-            return {'total_users': 0, 'active_users': 0, 'challenge_stats': []}
+            )
+            SELECT (SELECT total FROM t) AS total_users,
+                   (SELECT active FROM a) AS active_users,
+                   COALESCE((SELECT array_agg(challenge_id ORDER BY challenge_id) FROM c), '{}') AS challenge_ids,
+                   COALESCE((SELECT array_agg(completions ORDER BY challenge_id) FROM c), '{}') AS completions
+        ''')
+        
+        return {
+            'total_users': row['total_users'],
+            'active_users': row['active_users'],
+            'challenge_stats': [
+                {'challenge_id': challenge_id, 'completions': completions}
+                for challenge_id, completions in zip(row['challenge_ids'], row['completions'])
+            ]
+        }
     
     @staticmethod
     async def get_all_users():
@@ -65,12 +65,15 @@ async def create_sample_data():
         # Usuario de prueba
         await Database.register_user(123456789, "test_user", "Usuario de Prueba")
         
-        # Progreso de prueba
-        await db_manager.execute_command('''
+        # Progreso de prueba (todas las filas en un solo executemany)
+        sample_progress = [
+            (123456789, 0, 'FLAG{INICIO_INVESTIGACION}', True),
+        ]
+        await db_manager.execute_many('''
             INSERT INTO progress (user_id, challenge_id, flag_submitted, is_correct)
             VALUES ($1, $2, $3, $4)
             ON CONFLICT (user_id, challenge_id, flag_submitted) DO NOTHING
-        ''', 123456789, 0, 'FLAG{INICIO_INVESTIGACION}', True)
+        ''', sample_progress)
         
         logger.info("✅ Datos de ejemplo creados")
         return True